@@ -1,4 +1,5 @@
 # Save this as ModifiedSMCReader.py
+import os
 import h5py
 import cv2
 import numpy as np 
@@ -6,14 +7,24 @@ from tqdm import tqdm
 
 class SMCReader:
 
-    def __init__(self, file_path):
+    def __init__(self, file_path, frame_cache=None):
         """Read SenseMocapFile endswith ".smc".
 
         Args:
             file_path (str):
                 Path to an SMC file.
+            frame_cache (object, optional):
+                Cache consulted by get_img() before reading HDF5, e.g. a
+                SharedFrameCache shared by all processes on the node. Any
+                object with get(key) and put(key, img) works.
         """
         self.smc = h5py.File(file_path, 'r')
+        self.frame_cache = frame_cache
+        self.__file_key__ = None
+        if frame_cache is not None:
+            # A rewritten file must not be served frames decoded from the old one
+            st = os.stat(file_path)
+            self.__file_key__ = (os.path.abspath(file_path), st.st_size, st.st_mtime_ns)
         self.__calibration_dict__ = None
         self.__kinect_calib_dict__ = None 
         self.__available_keys__ = list(self.smc.keys())
@@ -68,6 +79,11 @@ class SMCReader:
 
         if isinstance(Frame_id, (str,int)):
             Frame_id = str(Frame_id)
+            if self.frame_cache is not None:
+                cache_key = (self.__file_key__, Camera_group, Camera_id, Image_type, Frame_id)
+                img_color = self.frame_cache.get(cache_key)
+                if img_color is not None:
+                    return img_color
             assert(Frame_id in self.smc[Camera_group][Camera_id][Image_type].keys())
             if Image_type in ['color']:
                 img_byte = self.smc[Camera_group][Camera_id][Image_type][Frame_id][()]
@@ -78,6 +94,8 @@ class SMCReader:
                 img_color = np.max(img_color,2)
             if Image_type == 'depth':
                 img_color = self.smc[Camera_group][Camera_id][Image_type][Frame_id][()]
+            if self.frame_cache is not None:
+                self.frame_cache.put(cache_key, img_color)
             return img_color           
         else:
             if Frame_id is None:
@@ -171,6 +189,8 @@ class SMCReader:
     def release(self):
         self.smc.close()
         self.smc = None 
+        self.frame_cache = None
+        self.__file_key__ = None
         self.__calibration_dict__ = None
         self.__kinect_calib_dict__ = None
         self.__available_keys__ = None
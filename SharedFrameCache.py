@@ -0,0 +1,419 @@
+# Save this as SharedFrameCache.py
+import os
+import sys
+import errno
+import json
+import fcntl
+import hashlib
+import threading
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+
+_MAGIC = 0x534D43464342  # "SMCFCB"
+_HEADER_BYTES = 128
+_ALIGN = 64
+_MAX_NDIM = 4
+_SHM_DIR = '/dev/shm'
+# Must not depend on TMPDIR, which schedulers often set per job
+_LOCK_DIR = _SHM_DIR if os.path.isdir(_SHM_DIR) else '/tmp'
+
+# Header fields (int64 each), geometry first, then state reset by clear()
+_H_MAGIC, _H_NUM_SETS, _H_WAYS, _H_ARENA, _H_FIFO_CAP, _H_HEAD, _H_TICK, _H_SEQ, \
+    _H_HITS, _H_MISSES, _H_EVICTIONS, _H_ENTRIES, _H_USED, \
+    _H_FIFO_HEAD, _H_FIFO_LEN = range(15)
+
+_SLOT_DTYPE = np.dtype([
+    ('key', '<u8', (2,)),
+    ('offset', '<i8'),
+    ('nbytes', '<i8'),
+    ('dtype', 'S8'),
+    ('ndim', '<i8'),
+    ('shape', '<i8', (_MAX_NDIM,)),
+    ('tick', '<i8'),
+    ('seq', '<i8'),
+    ('valid', '<i8'),
+])
+
+# Frames in allocation order, i.e. in arena offset order starting at the oldest
+_FIFO_DTYPE = np.dtype([
+    ('slot', '<i8'),
+    ('seq', '<i8'),
+    ('offset', '<i8'),
+])
+
+
+class SharedFrameCache:
+
+    def __init__(self, name='smc_frame_cache', size_bytes=256 << 20,
+                 num_slots=4096, ways=8, create=True):
+        """Node-local frame cache shared by every process on the machine.
+
+        Decoded frames live in a named ``multiprocessing.shared_memory``
+        segment, so processes that open the same ``.smc`` files only pay
+        the HDF5 read and decode once. The first process to open ``name``
+        creates the segment; later ones attach to it and use its stored
+        geometry. The segment outlives the processes using it until
+        ``unlink()`` is called.
+
+        Frames are stored in a ring-allocated data arena (oldest bytes are
+        overwritten first) and indexed by a set-associative table (least
+        recently used way is replaced when a set is full). A FIFO of the
+        stored frames in arena order lets a put evict only the frames it
+        overwrites. Index lookups and bookkeeping hold a node-wide ``flock``.
+        get() copies the frame out without holding it and drops the copy if
+        the frame was evicted meanwhile, so readers run in parallel. put()
+        copies the frame in while holding the lock, so writers take turns.
+
+        Size the budget to the working set: the default 256 MiB holds about
+        17 decoded 5MP color frames (2448x2048x3) or 7 12MP ones (4096x3000x3).
+
+        Args:
+            name (str):
+                Name of the shared-memory segment, identical across processes.
+            size_bytes (int):
+                Byte budget of the data arena. It is reserved in /dev/shm when
+                the segment is created, so it must fit in the free space there,
+                which is only 64 MiB in a default Docker container.
+            num_slots (int):
+                Maximum number of cached frames (rounded up to ``ways``).
+            ways (int):
+                Associativity of the index table.
+            create (bool):
+                Create the segment if it does not exist yet; otherwise raise
+                FileNotFoundError.
+        """
+        self.name = name
+        self.lock_path = os.path.join(_LOCK_DIR, f'{name}.lock')
+        self.shm = None
+        self.__open_lock__()
+
+        try:
+            with self:
+                try:
+                    self.shm = self.__open_shm__(create=False)
+                    created = False
+                except FileNotFoundError:
+                    if not create:
+                        raise
+                    num_sets = max(1, -(-int(num_slots) // int(ways)))
+                    # Room for the live frames plus as many stale entries
+                    fifo_cap = 2 * num_sets * ways
+                    index_bytes = (num_sets * ways * _SLOT_DTYPE.itemsize
+                                   + fifo_cap * _FIFO_DTYPE.itemsize)
+                    arena_bytes = -(-int(size_bytes) // _ALIGN) * _ALIGN
+                    total = _HEADER_BYTES + index_bytes + arena_bytes
+                    self.__check_shm_space__(total)
+                    self.shm = self.__open_shm__(create=True, size=total)
+                    self.__reserve_shm__(self.shm, total)
+                    created = True
+
+                self.__header__ = np.ndarray((_HEADER_BYTES // 8,), dtype='<i8',
+                                             buffer=self.shm.buf)
+                if created:
+                    self.__header__[:] = 0
+                    self.__header__[_H_NUM_SETS] = num_sets
+                    self.__header__[_H_WAYS] = ways
+                    self.__header__[_H_ARENA] = arena_bytes
+                    self.__header__[_H_FIFO_CAP] = fifo_cap
+                    self.__header__[_H_MAGIC] = _MAGIC
+                elif self.__header__[_H_MAGIC] != _MAGIC:
+                    raise RuntimeError(f"Shared memory '{name}' is not a frame cache")
+
+                self.num_sets = int(self.__header__[_H_NUM_SETS])
+                self.ways = int(self.__header__[_H_WAYS])
+                self.arena_size = int(self.__header__[_H_ARENA])
+                self.fifo_cap = int(self.__header__[_H_FIFO_CAP])
+                slot_bytes = self.num_sets * self.ways * _SLOT_DTYPE.itemsize
+                index_bytes = slot_bytes + self.fifo_cap * _FIFO_DTYPE.itemsize
+                self.__slot_table__ = np.ndarray((self.num_sets, self.ways),
+                                                 dtype=_SLOT_DTYPE, buffer=self.shm.buf,
+                                                 offset=_HEADER_BYTES)
+                self.__fifo__ = np.ndarray((self.fifo_cap,), dtype=_FIFO_DTYPE,
+                                           buffer=self.shm.buf,
+                                           offset=_HEADER_BYTES + slot_bytes)
+                if created:
+                    self.__slot_table__['valid'] = 0
+                self.__arena__ = np.ndarray((self.arena_size,), dtype=np.uint8,
+                                            buffer=self.shm.buf,
+                                            offset=_HEADER_BYTES + index_bytes)
+        except BaseException:
+            # Views into the segment must go before it can be closed
+            self.__header__ = None
+            self.__slot_table__ = None
+            self.__fifo__ = None
+            self.__arena__ = None
+            if self.shm is not None:
+                self.shm.close()
+            os.close(self.__lock_fd__)
+            raise
+
+    def __open_shm__(self, create, size=0):
+        # Keep the segment alive after this process exits; the resource
+        # tracker would otherwise unlink it from under the other workers.
+        if sys.version_info >= (3, 13):
+            return shared_memory.SharedMemory(self.name, create=create, size=size,
+                                              track=False)
+        shm = shared_memory.SharedMemory(self.name, create=create, size=size)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+    @staticmethod
+    def __shm_space_error__(total):
+        free = 0
+        if os.path.isdir(_SHM_DIR):
+            st = os.statvfs(_SHM_DIR)
+            free = st.f_bavail * st.f_frsize
+        return MemoryError(f"Frame cache needs {total / 2**20:.1f} MiB but only "
+                           f"{free / 2**20:.1f} MiB is free in {_SHM_DIR}, "
+                           f"lower size_bytes or enlarge {_SHM_DIR}")
+
+    @classmethod
+    def __check_shm_space__(cls, total):
+        # Fail early, before mapping a segment that can never fit. This does
+        # not reserve anything, see __reserve_shm__().
+        if not os.path.isdir(_SHM_DIR):
+            return
+        st = os.statvfs(_SHM_DIR)
+        if total > st.f_bavail * st.f_frsize:
+            raise cls.__shm_space_error__(total)
+
+    def __reserve_shm__(self, shm, total):
+        # tmpfs only allocates pages on first write, so a segment that was
+        # created fine can still hit a full /dev/shm inside put() and die of
+        # SIGBUS. Allocate every page now so that this fails here instead.
+        if not hasattr(os, 'posix_fallocate'):
+            return
+        try:
+            os.posix_fallocate(shm._fd, 0, total)
+        except OSError as e:
+            self.__unlink_shm__(shm)
+            if e.errno in (errno.ENOSPC, errno.ENOMEM):
+                raise self.__shm_space_error__(total) from e
+            raise
+
+    @staticmethod
+    def __unlink_shm__(shm):
+        if sys.version_info < (3, 13):
+            # SharedMemory.unlink() unregisters, balance __open_shm__()
+            resource_tracker.register(shm._name, 'shared_memory')
+        shm.unlink()
+
+    def __open_lock__(self):
+        # flock belongs to the open file description, which a forked child
+        # shares with its parent, so every process needs its own descriptor.
+        # Threads of one process share it and are excluded by the thread lock.
+        self.__pid__ = os.getpid()
+        self.__lock_fd__ = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o666)
+        self.__thread_lock__ = threading.Lock()
+
+    def __enter__(self):
+        if self.__pid__ != os.getpid():
+            # Inherited through fork: the descriptor is shared with the parent
+            # and the thread lock may have been held by a thread that is gone.
+            os.close(self.__lock_fd__)
+            self.__open_lock__()
+        self.__thread_lock__.acquire()
+        fcntl.flock(self.__lock_fd__, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.__lock_fd__, fcntl.LOCK_UN)
+        self.__thread_lock__.release()
+
+    @staticmethod
+    def __digest__(key):
+        h = hashlib.blake2b(repr(key).encode(), digest_size=16).digest()
+        return np.frombuffer(h, dtype='<u8')
+
+    def __find__(self, digest):
+        ways = self.__slot_table__[int(digest[0] % self.num_sets)]
+        hit = np.nonzero((ways['valid'] != 0) & (ways['key'][:, 0] == digest[0])
+                         & (ways['key'][:, 1] == digest[1]))[0]
+        return ways, (int(hit[0]) if len(hit) else None)
+
+    def __drop__(self, slot, evicted):
+        self.__header__[_H_ENTRIES] -= 1
+        self.__header__[_H_USED] -= slot['nbytes']
+        if evicted:
+            self.__header__[_H_EVICTIONS] += 1
+        slot['valid'] = 0
+
+    def __pop_fifo__(self):
+        entry = self.__fifo__[self.__header__[_H_FIFO_HEAD]]
+        slot = self.__slot_table__.reshape(-1)[entry['slot']]
+        # Entries of frames already dropped or replaced are stale, skip them
+        if slot['valid'] != 0 and slot['seq'] == entry['seq']:
+            self.__drop__(slot, evicted=True)
+        self.__header__[_H_FIFO_HEAD] = (self.__header__[_H_FIFO_HEAD] + 1) % self.fifo_cap
+        self.__header__[_H_FIFO_LEN] -= 1
+
+    def __evict__(self, start, end):
+        # The oldest frames sit right after the write head, so the frames in
+        # [start, end) are always at the front of the FIFO.
+        while self.__header__[_H_FIFO_LEN] > 0:
+            offset = self.__fifo__[self.__header__[_H_FIFO_HEAD]]['offset']
+            if not start <= offset < end:
+                break
+            self.__pop_fifo__()
+
+    def get(self, key):
+        """Return a private copy of the cached frame for ``key``, or None."""
+        digest = self.__digest__(key)
+        with self:
+            ways, w = self.__find__(digest)
+            if w is None:
+                self.__header__[_H_MISSES] += 1
+                return None
+            slot = ways[w]
+            seq = int(slot['seq'])
+            shape = tuple(slot['shape'][:slot['ndim']])
+            start = int(slot['offset'])
+            nbytes = int(slot['nbytes'])
+            dtype = np.dtype(slot['dtype'].decode())
+
+        # Copy without the lock. A put() drops a frame under the lock before
+        # overwriting its bytes, so if the slot still holds the same frame
+        # afterwards the copy is intact.
+        img = self.__arena__[start:start + nbytes].view(dtype).reshape(shape).copy()
+
+        with self:
+            slot = ways[w]
+            if slot['valid'] == 0 or slot['seq'] != seq:
+                self.__header__[_H_MISSES] += 1
+                return None
+            self.__header__[_H_TICK] += 1
+            slot['tick'] = self.__header__[_H_TICK]
+            self.__header__[_H_HITS] += 1
+        return img
+
+    def put(self, key, img):
+        """Store ``img`` under ``key``. Returns False if it cannot be cached."""
+        if img is None:
+            return False
+        img = np.ascontiguousarray(img)
+        if img.dtype.hasobject:
+            return False
+        nbytes = img.nbytes
+        need = -(-nbytes // _ALIGN) * _ALIGN
+        if nbytes == 0 or img.ndim > _MAX_NDIM or len(img.dtype.str) > 8 or need > self.arena_size:
+            return False
+        digest = self.__digest__(key)
+        set_id = int(digest[0] % self.num_sets)
+        with self:
+            ways, w = self.__find__(digest)
+            if w is not None:
+                self.__drop__(ways[w], evicted=False)
+
+            start = int(self.__header__[_H_HEAD])
+            if start + need > self.arena_size:
+                # Wrap around, the frames left at the end are the oldest ones
+                self.__evict__(start, self.arena_size)
+                start = 0
+            end = start + need
+            self.__evict__(start, end)
+            if self.__header__[_H_FIFO_LEN] == self.fifo_cap:
+                self.__pop_fifo__()
+
+            free = np.nonzero(ways['valid'] == 0)[0]
+            if len(free):
+                w = int(free[0])
+            else:
+                w = int(np.argmin(ways['tick']))
+                self.__drop__(ways[w], evicted=True)
+
+            self.__arena__[start:start + nbytes] = img.reshape(-1).view(np.uint8)
+            self.__header__[_H_HEAD] = end
+            self.__header__[_H_TICK] += 1
+            self.__header__[_H_SEQ] += 1
+
+            tail = (self.__header__[_H_FIFO_HEAD] + self.__header__[_H_FIFO_LEN]) % self.fifo_cap
+            entry = self.__fifo__[tail]
+            entry['slot'] = set_id * self.ways + w
+            entry['seq'] = self.__header__[_H_SEQ]
+            entry['offset'] = start
+            self.__header__[_H_FIFO_LEN] += 1
+
+            slot = ways[w]
+            slot['key'] = digest
+            slot['offset'] = start
+            slot['nbytes'] = nbytes
+            slot['dtype'] = img.dtype.str.encode()
+            slot['ndim'] = img.ndim
+            slot['shape'] = 0
+            slot['shape'][:img.ndim] = img.shape
+            slot['tick'] = self.__header__[_H_TICK]
+            slot['seq'] = self.__header__[_H_SEQ]
+            slot['valid'] = 1
+            self.__header__[_H_ENTRIES] += 1
+            self.__header__[_H_USED] += nbytes
+        return True
+
+    def clear(self):
+        """Drop every cached frame and reset the counters."""
+        with self:
+            self.__slot_table__['valid'] = 0
+            # Keep seq increasing, get() relies on it to detect reused slots
+            seq = self.__header__[_H_SEQ]
+            self.__header__[_H_HEAD:] = 0
+            self.__header__[_H_SEQ] = seq
+
+    def stats(self):
+        """Get hit rate and occupancy of the cache, aggregated over all processes.
+
+        Returns:
+            Dictionary with hits, misses, hit_rate, evictions, entries,
+            max_entries, used_bytes, capacity_bytes and occupancy.
+        """
+        with self:
+            h = self.__header__.copy()
+        lookups = h[_H_HITS] + h[_H_MISSES]
+        return dict(
+            name=self.name,
+            hits=int(h[_H_HITS]),
+            misses=int(h[_H_MISSES]),
+            hit_rate=float(h[_H_HITS] / lookups) if lookups else 0.0,
+            evictions=int(h[_H_EVICTIONS]),
+            entries=int(h[_H_ENTRIES]),
+            max_entries=self.num_sets * self.ways,
+            used_bytes=int(h[_H_USED]),
+            capacity_bytes=self.arena_size,
+            occupancy=float(h[_H_USED] / self.arena_size),
+        )
+
+    def release(self):
+        """Detach this process from the cache; the cached frames stay."""
+        self.__header__ = None
+        self.__slot_table__ = None
+        self.__fifo__ = None
+        self.__arena__ = None
+        self.shm.close()
+        os.close(self.__lock_fd__)
+        self.__lock_fd__ = None
+
+    def unlink(self):
+        """Detach and destroy the shared segment for every process on the node."""
+        shm = self.shm
+        self.release()
+        self.__unlink_shm__(shm)
+        try:
+            os.remove(self.lock_path)
+        except FileNotFoundError:
+            pass
+
+
+if __name__ == '__main__':
+    # Usage: python SharedFrameCache.py [name] [--unlink]
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    cache_name = args[0] if args else 'smc_frame_cache'
+    try:
+        cache = SharedFrameCache(cache_name, create=False)
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        sys.exit(1)
+    print(json.dumps(cache.stats(), indent=2))
+    if '--unlink' in sys.argv:
+        cache.unlink()
+        print(f"Shared frame cache '{cache_name}' removed")
+    else:
+        cache.release()
@@ -0,0 +1,132 @@
+import os
+import uuid
+
+import numpy as np
+import pytest
+
+h5py = pytest.importorskip('h5py')
+cv2 = pytest.importorskip('cv2')
+pytest.importorskip('tqdm')
+
+from ModifiedSMCReader import SMCReader
+from SharedFrameCache import SharedFrameCache
+
+
+class _StubCache:
+
+    def __init__(self):
+        self.frames = {}
+        self.calls = []
+
+    def get(self, key):
+        self.calls.append(('get', key))
+        return self.frames.get(key)
+
+    def put(self, key, img):
+        self.calls.append(('put', key))
+        self.frames[key] = img
+        return True
+
+
+def _color(i):
+    return np.full((6, 8, 3), 10 * i, dtype=np.uint8)
+
+
+def _depth(i):
+    return np.full((6, 8), 1000 + i, dtype=np.uint16)
+
+
+@pytest.fixture
+def smc_path(tmp_path):
+    path = str(tmp_path / 'sample.smc')
+    with h5py.File(path, 'w') as f:
+        group = f.create_group('Camera_5mp')
+        group.attrs['num_device'] = 1
+        group.attrs['num_frame'] = 2
+        group.attrs['resolution'] = [8, 6]
+        for i in range(2):
+            # PNG keeps the decoded color frame identical to _color(i)
+            f[f'Camera_5mp/0/color/{i}'] = cv2.imencode('.png', _color(i))[1]
+            f[f'Camera_5mp/0/depth/{i}'] = _depth(i)
+    return path
+
+
+def test_no_cache_keeps_old_behavior(smc_path):
+    reader = SMCReader(smc_path)
+    assert reader.frame_cache is None and reader.__file_key__ is None
+    assert np.array_equal(reader.get_img('Camera_5mp', 0, 'color', 1), _color(1))
+    reader.release()
+
+
+def test_miss_reads_hdf5_and_fills_cache(smc_path):
+    cache = _StubCache()
+    reader = SMCReader(smc_path, frame_cache=cache)
+    img = reader.get_img('Camera_5mp', 0, 'color', 1)
+    key = (reader.__file_key__, 'Camera_5mp', '0', 'color', '1')
+    assert cache.calls == [('get', key), ('put', key)]
+    assert np.array_equal(img, _color(1))
+    assert cache.frames[key] is img
+
+    depth = reader.get_img('Camera_5mp', 0, 'depth', 0)
+    assert np.array_equal(depth, _depth(0)) and depth.dtype == np.uint16
+    assert ('put', (reader.__file_key__, 'Camera_5mp', '0', 'depth', '0')) in cache.calls
+    reader.release()
+
+
+def test_hit_skips_hdf5(smc_path, monkeypatch):
+    cache = _StubCache()
+    reader = SMCReader(smc_path, frame_cache=cache)
+    cached = np.zeros((6, 8, 3), dtype=np.uint8)
+    key = (reader.__file_key__, 'Camera_5mp', '0', 'color', '0')
+    cache.frames[key] = cached
+
+    def no_decode(color_array):
+        raise AssertionError('frame was decoded despite a cache hit')
+    monkeypatch.setattr(reader, '__read_color_from_bytes__', no_decode)
+    assert reader.get_img('Camera_5mp', 0, 'color', 0) is cached
+    assert cache.calls == [('get', key)]
+    reader.release()
+
+
+def test_frame_list_goes_through_cache(smc_path):
+    cache = _StubCache()
+    reader = SMCReader(smc_path, frame_cache=cache)
+    imgs = reader.get_img('Camera_5mp', 0, 'depth', [0, 1], disable_tqdm=True)
+    assert np.array_equal(imgs, np.stack([_depth(0), _depth(1)]))
+    assert [c[0] for c in cache.calls] == ['get', 'put', 'get', 'put']
+    reader.release()
+
+
+def test_key_follows_file_size_and_mtime(smc_path):
+    old = SMCReader(smc_path, frame_cache=_StubCache())
+    old_key = old.__file_key__
+    old.release()
+
+    st = os.stat(smc_path)
+    os.utime(smc_path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    touched = SMCReader(smc_path, frame_cache=_StubCache())
+    assert touched.__file_key__ != old_key
+    touched.release()
+
+    with h5py.File(smc_path, 'a') as f:
+        f['padding'] = np.zeros(4096, dtype=np.uint8)
+    os.utime(smc_path, ns=(st.st_atime_ns, st.st_mtime_ns))
+    grown = SMCReader(smc_path, frame_cache=_StubCache())
+    assert grown.__file_key__[2] == old_key[2] and grown.__file_key__ != old_key
+    grown.release()
+
+
+def test_readers_share_frames_through_shared_cache(smc_path):
+    cache = SharedFrameCache(f'test_smc_{os.getpid()}_{uuid.uuid4().hex[:8]}',
+                             size_bytes=1 << 20, num_slots=16, ways=4)
+    try:
+        first = SMCReader(smc_path, frame_cache=cache)
+        second = SMCReader(smc_path, frame_cache=cache)
+        assert np.array_equal(first.get_img('Camera_5mp', 0, 'color', 1), _color(1))
+        assert np.array_equal(second.get_img('Camera_5mp', 0, 'color', 1), _color(1))
+        stats = cache.stats()
+        assert (stats['hits'], stats['misses'], stats['entries']) == (1, 1, 1)
+        first.release()
+        second.release()
+    finally:
+        cache.unlink()
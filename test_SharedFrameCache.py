@@ -0,0 +1,246 @@
+import os
+import errno
+import uuid
+import tempfile
+import threading
+import multiprocessing as mp
+from multiprocessing import resource_tracker
+
+import numpy as np
+import pytest
+
+from SharedFrameCache import SharedFrameCache, _LOCK_DIR, _SHM_DIR
+
+_cache = None
+
+
+def _frame(i):
+    # Frame contents and size both depend on the key, so torn or misplaced
+    # reads are detected.
+    return np.full((32 + i % 7, 48, 3), i % 251, dtype=np.uint8)
+
+
+@pytest.fixture
+def cache_name():
+    name = f'test_sfc_{os.getpid()}_{uuid.uuid4().hex[:8]}'
+    yield name
+    try:
+        SharedFrameCache(name, create=False).unlink()
+    except FileNotFoundError:
+        lock_path = os.path.join(_LOCK_DIR, f'{name}.lock')
+        if os.path.exists(lock_path):
+            os.remove(lock_path)
+
+
+def _check_stats(stats):
+    assert 0 <= stats['entries'] <= stats['max_entries']
+    assert 0 <= stats['used_bytes'] <= stats['capacity_bytes']
+
+
+def _no_space(fd, offset, length):
+    # Stands in for os.posix_fallocate on a full /dev/shm
+    raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC))
+
+
+def _worker(args):
+    # Without a name, use the module-level cache inherited through fork.
+    name, seed, num_keys, rounds = args
+    cache = SharedFrameCache(name, create=False) if name else _cache
+    rng = np.random.default_rng(seed)
+    bad = 0
+    for _ in range(rounds):
+        i = int(rng.integers(num_keys))
+        img = cache.get(('frame', i))
+        if img is None:
+            cache.put(('frame', i), _frame(i))
+        elif not np.array_equal(img, _frame(i)):
+            bad += 1
+        if rng.integers(50) == 0:
+            _check_stats(cache.stats())
+    if name:
+        cache.release()
+    return bad
+
+
+def test_round_trip(cache_name):
+    cache = SharedFrameCache(cache_name, size_bytes=1 << 20, num_slots=16, ways=4)
+    color = np.random.randint(0, 255, (20, 30, 3), dtype=np.uint8)
+    depth = np.random.randint(0, 4000, (20, 30), dtype=np.uint16)
+    assert cache.get('color') is None
+    assert cache.put('color', color)
+    assert cache.put('depth', depth)
+    for key, img in [('color', color), ('depth', depth)]:
+        out = cache.get(key)
+        assert out.dtype == img.dtype and np.array_equal(out, img)
+    # Callers get a private copy
+    out = cache.get('color')
+    out[:] = 0
+    assert np.array_equal(cache.get('color'), color)
+    assert not cache.put('none', None)
+    assert not cache.put('huge', np.zeros(2 << 20, dtype=np.uint8))
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (4, 1, 2)
+    assert stats['used_bytes'] == color.nbytes + depth.nbytes
+    cache.release()
+
+
+def test_overwrite_key(cache_name):
+    cache = SharedFrameCache(cache_name, size_bytes=1 << 20, num_slots=16, ways=4)
+    cache.put('k', _frame(1))
+    cache.put('k', _frame(2))
+    assert np.array_equal(cache.get('k'), _frame(2))
+    stats = cache.stats()
+    assert stats['entries'] == 1 and stats['evictions'] == 0
+    assert stats['used_bytes'] == _frame(2).nbytes
+    cache.release()
+
+
+def test_ring_wrap_evicts_oldest(cache_name):
+    img = np.ones((1024,), dtype=np.uint8)
+    cache = SharedFrameCache(cache_name, size_bytes=4 * img.nbytes, num_slots=64, ways=8)
+    for i in range(10):
+        assert cache.put(i, img * i)
+        _check_stats(cache.stats())
+    assert all(cache.get(i) is None for i in range(6))
+    assert all(np.array_equal(cache.get(i), img * i) for i in range(6, 10))
+    stats = cache.stats()
+    assert stats['entries'] == 4 and stats['evictions'] == 6
+    assert stats['occupancy'] == 1.0
+    cache.release()
+
+
+def test_lru_within_set(cache_name):
+    # A single set of four ways, with an arena large enough to never wrap
+    cache = SharedFrameCache(cache_name, size_bytes=1 << 20, num_slots=4, ways=4)
+    for i in range(4):
+        cache.put(i, _frame(i))
+    cache.get(0)
+    cache.put(4, _frame(4))
+    assert cache.get(1) is None
+    assert all(np.array_equal(cache.get(i), _frame(i)) for i in (0, 2, 3, 4))
+    stats = cache.stats()
+    assert stats['entries'] == 4 and stats['evictions'] == 1
+    cache.release()
+
+
+def test_clear(cache_name):
+    cache = SharedFrameCache(cache_name, size_bytes=1 << 20, num_slots=16, ways=4)
+    cache.put('k', _frame(1))
+    cache.clear()
+    assert cache.get('k') is None
+    cache.put('k', _frame(1))
+    stats = cache.stats()
+    assert stats['entries'] == 1 and stats['used_bytes'] == _frame(1).nbytes
+    cache.release()
+
+
+def test_oversized_cache_is_refused(cache_name):
+    with pytest.raises(MemoryError):
+        SharedFrameCache(cache_name, size_bytes=1 << 50)
+    with pytest.raises(FileNotFoundError):
+        SharedFrameCache(cache_name, create=False)
+
+
+def test_reads_racing_overwrites_are_discarded(cache_name):
+    # Large frames in a four-frame arena, so the writer keeps overwriting
+    # frames that readers are copying outside the lock.
+    cache = SharedFrameCache(cache_name, size_bytes=4 << 20, num_slots=64, ways=8)
+    frames = [np.full((1 << 20,), i, dtype=np.uint8) for i in range(8)]
+    stop = threading.Event()
+    bad = []
+
+    def read():
+        while not stop.is_set():
+            for i in range(8):
+                img = cache.get(i)
+                if img is not None and not (img == i).all():
+                    bad.append(i)
+
+    readers = [threading.Thread(target=read) for _ in range(3)]
+    for t in readers:
+        t.start()
+    for n in range(400):
+        cache.put(n % 8, frames[n % 8])
+    stop.set()
+    for t in readers:
+        t.join()
+    assert bad == []
+    _check_stats(cache.stats())
+    cache.release()
+
+
+def test_lock_path_ignores_tmpdir(cache_name, tmp_path, monkeypatch):
+    cache = SharedFrameCache(cache_name, size_bytes=1 << 20, num_slots=16, ways=4)
+    # A second job on the node with its own TMPDIR must take the same lock
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    other = SharedFrameCache(cache_name, create=False)
+    assert other.lock_path == cache.lock_path
+    assert not other.lock_path.startswith(str(tmp_path))
+    other.release()
+    cache.release()
+
+
+def test_full_shm_is_reported_at_creation(cache_name, monkeypatch):
+    monkeypatch.setattr(os, 'posix_fallocate', _no_space, raising=False)
+    with pytest.raises(MemoryError):
+        SharedFrameCache(cache_name, size_bytes=1 << 20)
+    with pytest.raises(FileNotFoundError):
+        SharedFrameCache(cache_name, create=False)
+
+
+def test_failed_open_does_not_leak(cache_name, monkeypatch):
+    def num_fds():
+        return len(os.listdir('/proc/self/fd'))
+
+    # The tracker opens a pipe the first time a segment is created
+    resource_tracker.ensure_running()
+    before = num_fds()
+    with pytest.raises(MemoryError):
+        SharedFrameCache(cache_name, size_bytes=1 << 50)
+    # A segment of that name that is not a frame cache
+    foreign = os.path.join(_SHM_DIR, cache_name)
+    with open(foreign, 'wb') as f:
+        f.write(bytes(4096))
+    try:
+        with pytest.raises(RuntimeError):
+            SharedFrameCache(cache_name)
+    finally:
+        os.remove(foreign)
+    monkeypatch.setattr(os, 'posix_fallocate', _no_space, raising=False)
+    with pytest.raises(MemoryError):
+        SharedFrameCache(cache_name, size_bytes=1 << 20)
+    assert num_fds() == before
+
+
+def test_forked_workers_share_inherited_cache(cache_name):
+    global _cache
+    _cache = SharedFrameCache(cache_name, size_bytes=2 << 20, num_slots=64, ways=4)
+    try:
+        with mp.get_context('fork').Pool(4) as pool:
+            bad = pool.map(_worker, [(None, seed, 200, 2000) for seed in range(4)])
+        assert bad == [0, 0, 0, 0]
+        _check_stats(_cache.stats())
+    finally:
+        _cache.release()
+        _cache = None
+
+
+def test_concurrent_spawned_and_forked_writers(cache_name):
+    global _cache
+    # Small arena and index so that ring wraps and set evictions both happen
+    _cache = SharedFrameCache(cache_name, size_bytes=256 << 10, num_slots=32, ways=4)
+    try:
+        with mp.get_context('fork').Pool(3) as forked, \
+                mp.get_context('spawn').Pool(3) as spawned:
+            fork_res = forked.map_async(
+                _worker, [(None, seed, 300, 2000) for seed in range(3)])
+            spawn_res = spawned.map_async(
+                _worker, [(cache_name, seed, 300, 2000) for seed in range(3, 6)])
+            bad = fork_res.get(120) + spawn_res.get(120)
+        assert bad == [0] * 6
+        stats = _cache.stats()
+        _check_stats(stats)
+        assert stats['evictions'] > 0 and stats['hits'] > 0
+    finally:
+        _cache.release()
+        _cache = None